@@ -2,11 +2,129 @@ import numpy as np
 import pandas as pd
 import seaborn as sns
 import matplotlib.pyplot as plt
-from scipy.stats import spearmanr, pearsonr
+from scipy.stats import spearmanr, pearsonr, rankdata, distributions
 import statsmodels.stats.multitest as multi
-from qiime2 import Artifact, Metadata
 from . import common, utils
 
+try:
+    from numba import njit, prange
+except ImportError:
+    njit, prange = None, range
+
+def _rank_cols(X):
+    """
+    Rank each column of ``X`` with tie averaging, equivalent to
+    ``scipy.stats.rankdata(X, axis=0)``.
+    """
+    n, m = X.shape
+    ranks = np.empty((n, m))
+    for j in prange(m):
+        col = X[:, j]
+        order = np.argsort(col)
+        i = 0
+        while i < n:
+            k = i
+            while k + 1 < n and col[order[k + 1]] == col[order[i]]:
+                k += 1
+            rank = (i + k) / 2 + 1
+            for u in range(i, k + 1):
+                ranks[order[u], j] = rank
+            i = k + 1
+    return ranks
+
+if njit is not None:
+    _rank_cols = njit(parallel=True, fastmath=True)(_rank_cols)
+else:
+    def _rank_cols(X):
+        return rankdata(X, axis=0)
+
+def _bh(pvals):
+    """
+    Adjust p values with the Benjamini-Hochberg procedure, equivalent to
+    ``multipletests(pvals, method='fdr_bh')[1]``.
+    """
+    order = np.argsort(pvals)
+    ranked = pvals[order] * len(pvals) / np.arange(1, len(pvals) + 1)
+    adj = np.minimum.accumulate(ranked[::-1])[::-1]
+    out = np.empty_like(adj)
+    out[order] = np.clip(adj, 0, 1)
+    return out
+
+def _cross_association_matrices(
+    artifact, target, method='spearman', normalize=None, multitest='fdr_bh',
+    pvalues=True
+):
+    """
+    Compute the correlation, p-value, and adjusted p-value matrices of
+    shape (taxa, targets) for cross-association analysis. When ``pvalues``
+    is False, skip the p-value and multiple-testing stage and return None
+    for both matrices.
+    """
+    feats = utils.import_feature_table(artifact)
+
+    if normalize is not None:
+        feats = utils.normalize_feature_table(feats, normalize)
+
+    n, nf = feats.shape
+
+    if method == 'spearman':
+        X = np.ascontiguousarray(feats.values, dtype=float)
+        Y = np.ascontiguousarray(target.values, dtype=float)
+        if np.isnan(X).any() or np.isnan(Y).any():
+            rho = spearmanr(X, Y)[0]
+            if np.ndim(rho) == 0:
+                rho = np.array([[1, rho], [rho, 1]])
+            corr = rho[:nf, nf:]
+        else:
+            rf = _rank_cols(X).astype(np.float32)
+            rt = _rank_cols(Y).astype(np.float32)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rf = (rf - rf.mean(axis=0)) / rf.std(axis=0, ddof=1)
+                rt = (rt - rt.mean(axis=0)) / rt.std(axis=0, ddof=1)
+                corr = (rf.T @ rt / (n - 1)).astype(float)
+                np.clip(corr, -1.0, 1.0, out=corr)
+    elif method == 'pearson':
+        X = np.ascontiguousarray(feats.values, dtype=float)
+        Y = np.ascontiguousarray(target.values, dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            Xc = (X - X.mean(axis=0)) / X.std(axis=0, ddof=1)
+            Yc = (Y - Y.mean(axis=0)) / Y.std(axis=0, ddof=1)
+            corr = Xc.T @ Yc / (n - 1)
+            np.clip(corr, -1.0, 1.0, out=corr)
+    else:
+        raise ValueError(f"Incorrect association method: '{method}'")
+
+    if not pvalues:
+        return corr, None, None, feats.columns, target.columns
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = corr * np.sqrt((n - 2) / (1 - corr * corr))
+
+    pval = 2 * distributions.t.sf(np.abs(t), n - 2)
+
+    if multitest == 'fdr_bh':
+        adjp = _bh(pval.ravel()).reshape(pval.shape)
+    else:
+        adjp = multi.multipletests(pval.ravel(),
+            method=multitest)[1].reshape(pval.shape)
+
+    return corr, pval, adjp, feats.columns, target.columns
+
+def _nsig_filter(corr, pval, adjp, taxa, targets, alpha, nsig):
+    """
+    Keep only taxa and targets with at least ``nsig`` significant
+    correlations.
+    """
+    sig = adjp <= alpha
+    taxon_mask = sig.sum(axis=1) >= nsig
+    target_mask = sig.sum(axis=0) >= nsig
+    corr = corr[taxon_mask][:, target_mask]
+    pval = pval[taxon_mask][:, target_mask]
+    adjp = adjp[taxon_mask][:, target_mask]
+    taxa = taxa[taxon_mask]
+    targets = targets[target_mask]
+    return corr, pval, adjp, taxa, targets
+
 def cross_association_table(
     artifact, target, method='spearman', normalize=None, alpha=0.05,
     multitest='fdr_bh', nsig=0
@@ -87,63 +205,25 @@ def cross_association_table(
         # 8                     Helicobacter    PC(40:3) -0.673201  5.530595e-07  0.003108
         # 9                    Moraxellaceae  PC(38:4).1 -0.670050  6.530463e-07  0.003302
     """
-    if isinstance(artifact, Artifact):
-        feats = artifact.view(pd.DataFrame)
-    elif isinstance(artifact, str):
-        feats = Artifact.load(artifact).view(pd.DataFrame)
-    elif isinstance(artifact, pd.DataFrame):
-        feats = artifact.copy()
-    else:
-        raise TypeError(f"Incorrect feature table type: {type(artifact)}")
-
-    if normalize == 'log10':
-        feats = feats.applymap(lambda x: np.log10(x + 1))
-    elif normalize == 'clr':
-        feats = feats.apply(lambda x: clr(x + 1), axis=1,
-            result_type='broadcast')
-    elif normalize == 'zscore':
-        feats = feats.apply(zscore, axis=1,
-            result_type='broadcast')
-    elif not normalize:
-        pass
-    else:
-        raise ValueError(f"Incorrect normalization method: '{normalize}'")
-
-    methods = {'pearson': pearsonr, 'spearman': spearmanr}
-
-    corr = np.zeros((feats.shape[1], target.shape[1]))
-    pval = np.zeros((feats.shape[1], target.shape[1]))
-
-    for i in range(feats.shape[1]):
-        for j in range(target.shape[1]):
-            results = methods[method](feats[feats.columns[i]],
-                target[target.columns[j]])
-            corr[i, j] = results[0]
-            pval[i, j] = results[1]
-
-    corr = pd.DataFrame(corr, columns=target.columns, index=feats.columns)
-    pval = pd.DataFrame(pval, columns=target.columns, index=feats.columns)
+    corr, pval, adjp, taxa, targets = _cross_association_matrices(
+        artifact, target, method=method, normalize=normalize,
+        multitest=multitest
+    )
 
-    corr = corr.melt(var_name='target', value_name='corr', ignore_index=False)
-    pval = pval.melt(var_name='target', value_name='pval', ignore_index=False)
+    if nsig:
+        corr, pval, adjp, taxa, targets = _nsig_filter(
+            corr, pval, adjp, taxa, targets, alpha, nsig)
 
-    df = pd.concat([corr, pval['pval']], axis=1)
-    df.index.name = 'taxon'
-    df = df.reset_index()
-    df['adjp'] = multi.multipletests(df['pval'], method=multitest)[1]
+    pval = pval.ravel(order='F')
+    order = np.argsort(pval)
 
-    if nsig:
-        adjp = df.pivot(index='taxon', columns='target', values='adjp')
-        sig = adjp <= alpha
-        s = sig.sum(axis=1)
-        taxon_survivors = s[s >= nsig].index.to_list()
-        s = sig.sum(axis=0)
-        target_survivors = s[s >= nsig].index.to_list()
-        df = df[df['taxon'].isin(taxon_survivors)]
-        df = df[df['target'].isin(target_survivors)]
-
-    df = df.sort_values('pval')
-    df = df.reset_index(drop=True)
+    df = pd.DataFrame({
+        'taxon': np.tile(taxa, len(targets))[order],
+        'target': np.repeat(targets, len(taxa))[order],
+        'corr': corr.ravel(order='F')[order],
+        'pval': pval[order],
+        'adjp': adjp.ravel(order='F')[order],
+    })
 
     return df
 
@@ -227,20 +307,19 @@ def cross_association_heatmap(
 
     .. image:: images/cross_association_heatmap_1.png
     """
-    df = cross_association_table(
-        artifact, target, method=method, normalize=normalize, alpha=alpha,
-        multitest=multitest, nsig=nsig
+    corr, pval, adjp, taxa, targets = _cross_association_matrices(
+        artifact, target, method=method, normalize=normalize,
+        multitest=multitest, pvalues=bool(nsig or marksig)
     )
 
-    corr = df.pivot(index='target', columns='taxon', values='corr')
+    if nsig:
+        corr, pval, adjp, taxa, targets = _nsig_filter(
+            corr, pval, adjp, taxa, targets, alpha, nsig)
+
+    corr = pd.DataFrame(corr.T, index=targets, columns=taxa)
 
     if marksig:
-        pval = df.pivot(index='target', columns='taxon', values='pval')
-        def val2sig(x):
-            if x <= alpha:
-                return '*'
-            return ''
-        annot = pval.applymap(val2sig)
+        annot = np.where(pval.T <= alpha, '*', '')
         fmt = ''
     else:
         annot = None
@@ -310,7 +389,7 @@ def cross_association_regplot(
 
     .. image:: images/cross_association_regplot.png
     """
-    df = pd.concat([artifact[taxon], target[name]], axis=1)
+    df = pd.DataFrame({taxon: artifact[taxon], name: target[name]})
 
     if ax is None:
         fig, ax = plt.subplots(figsize=figsize)
@@ -434,29 +513,35 @@ def group_correlation_heatmap(
     df2 = df.loc[group2_samples]
 
     methods = {'pearson': pearsonr, 'spearman': spearmanr}
+    func = methods[method]
 
     size = max(df1.shape[1], df2.shape[1])
 
     cols = [common.pname(x) for x in df1.columns]
 
-    rho_df = pd.DataFrame(np.zeros((size, size)), index=cols, columns=cols)
-    pval_df = pd.DataFrame(np.zeros((size, size)), index=cols, columns=cols)
+    arr1 = df1.values
+    arr2 = df2.values
 
-    for i, t1 in enumerate(df1.columns):
-        for j, t2 in enumerate(df2.columns):
-            rho, pval = methods[method](df1[t1], df2[t2])
+    rho = np.zeros((size, size))
+    pval = np.zeros((size, size))
 
-            if np.isnan(rho):
-                rho, pval = 0, 1
-            rho_df.iloc[i, j] = rho
-            pval_df.iloc[i, j] = pval
+    for i in range(arr1.shape[1]):
+        x = arr1[:, i]
+        for j in range(arr2.shape[1]):
+            results = func(x, arr2[:, j])
+
+            if np.isnan(results[0]):
+                results = (0, 1)
+            rho[i, j] = results[0]
+            pval[i, j] = results[1]
 
-    pval_df = pval_df.applymap(lambda x: '*' if x <= alpha else '')
+    rho_df = pd.DataFrame(rho, index=cols, columns=cols)
+    annot = np.where(pval <= alpha, '*', '')
 
     if ax is None:
         fig, ax = plt.subplots(figsize=figsize)
 
-    sns.heatmap(rho_df, annot=pval_df, fmt = '', ax=ax, vmin=-1,
+    sns.heatmap(rho_df, annot=annot, fmt = '', ax=ax, vmin=-1,
     vmax=1, **kwargs)
 
     ax.set_xlabel(group2_label)
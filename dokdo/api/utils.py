@@ -1,6 +1,5 @@
 import numpy as np
 import pandas as pd
-from skbio.stats.composition import clr
 from qiime2 import Artifact
 
 def import_feature_table(artifact):
@@ -21,15 +20,21 @@ def normalize_feature_table(df, method):
     """
     Normalize given feature table.
     """
+    arr = df.values
+
     if method == 'log10':
-        df = df.applymap(lambda x: np.log10(x + 1))
+        data = np.log10(arr + 1)
     elif method == 'clr':
-        df = df.apply(lambda x: clr(x + 1), axis=1, result_type='broadcast')
+        logs = np.log1p(arr)
+        data = logs - logs.mean(axis=1, keepdims=True)
     elif method == 'zscore':
-        df = df.apply(zscore, axis=1, result_type='broadcast')
+        mu = arr.mean(axis=1, keepdims=True)
+        sd = arr.std(axis=1, ddof=1, keepdims=True)
+        data = (arr - mu) / sd
     else:
         raise ValueError(f"Incorrect normalization method: {method}")
-    return df
+
+    return pd.DataFrame(data, index=df.index, columns=df.columns)
 
 def sort_by_mean(df):
     """
@@ -2,6 +2,12 @@ import pandas as pd
 from qiime2 import Metadata
 import warnings
 
+try:
+    import pyarrow
+    ENGINE = 'pyarrow'
+except ImportError:
+    ENGINE = 'c'
+
 def add_metadata(metadata_file,
                  columns_file,
                  output_file):
@@ -23,7 +29,7 @@ def add_metadata(metadata_file,
     mf1 = Metadata.load(metadata_file).to_dataframe()
     index_name = mf1.index.name
     dtypes = mf1.dtypes.to_dict()
-    mf2 = pd.read_table(columns_file, keep_default_na=False)
+    mf2 = pd.read_table(columns_file, keep_default_na=False, engine=ENGINE)
 
     for k, v in dtypes.items():
         if k in mf2.columns:
@@ -32,7 +38,15 @@ def add_metadata(metadata_file,
             else:
                 mf2[k] = mf2[k].astype(v)
 
-    mf3 = mf1.reset_index().merge(mf2).set_index(index_name)
+    common = [x for x in mf2.columns
+              if x == index_name or x in mf1.columns]
+
+    if common == [index_name]:
+        mf2[index_name] = mf2[index_name].astype(str)
+        mf3 = mf1.join(mf2.set_index(index_name), how='inner')
+    else:
+        mf3 = mf1.reset_index().merge(mf2).set_index(index_name)
+
     mf3 = mf3.reindex(mf1.index)
 
     a = mf1.shape[0]
@@ -1,12 +1,26 @@
 import os
+import multiprocessing
 import pandas as pd
 from qiime2 import Artifact
 from qiime2.plugins import taxa
 
+def _collapse_level(table_file, taxonomy_file, output_dir, level):
+    """Collapse the feature table at one taxonomic level and write
+    'level-<level>.csv'."""
+    _ = taxa.methods.collapse(
+        table=Artifact.load(table_file),
+        taxonomy=Artifact.load(taxonomy_file),
+        level=level)
+    _.collapsed_table.view(pd.DataFrame).T.to_csv(
+        f"{output_dir}/level-{level}.csv")
+
 def collapse(table_file, taxonomy_file, output_dir):
     """Create seven collapsed feature tables, one for each taxonomic
     level (i.e. 'level-1.csv' to 'level-7.csv').
 
+    The seven levels are collapsed in parallel, one worker process per
+    level.
+
     Parameters
     ----------
     table_file : str
@@ -17,10 +31,6 @@ def collapse(table_file, taxonomy_file, output_dir):
         Path to the output directory.
     """
     os.mkdir(output_dir)
-    for i in range(1, 8):
-        _ = taxa.methods.collapse(
-            table=Artifact.load(table_file),
-            taxonomy=Artifact.load(taxonomy_file),
-            level=i)
-        _.collapsed_table.view(pd.DataFrame).T.to_csv(
-            f"{output_dir}/level-{i}.csv")
+    args = [(table_file, taxonomy_file, output_dir, i) for i in range(1, 8)]
+    with multiprocessing.Pool(min(7, os.cpu_count())) as pool:
+        pool.starmap(_collapse_level, args)
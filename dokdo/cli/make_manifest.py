@@ -1,6 +1,9 @@
 import os
+import re
 from pathlib import Path
 
+FASTQ_PATTERN = re.compile(r'(.+)_[^_]+_R([12])_001\.fastq')
+
 def make_manifest(fastq_dir, output_file):
     """
     Create a manifest file (.tsv) from a directory containing FASTQ files.
@@ -23,23 +26,29 @@ def make_manifest(fastq_dir, output_file):
 
     files = {}
 
-    for r, d, f in os.walk(fastq_dir):
-        for x in f:
-            name = '_'.join(x.split('_')[:-3])
+    dirs = [str(fastq_dir)]
 
-            if 'Undetermined' in x:
-                continue
+    while dirs:
+        with os.scandir(dirs.pop()) as it:
+            for entry in it:
+                if entry.is_dir():
+                    dirs.append(entry.path)
+                    continue
+
+                if 'Undetermined' in entry.name:
+                    continue
+
+                matched = FASTQ_PATTERN.match(entry.name)
+
+                if matched is None:
+                    continue
+
+                name = matched.group(1)
 
-            if '_R1_001.fastq' in x:
-                if name not in files:
-                    files[name] = ['', '']
-                files[name][0] = f"{r}/{x}"
-            elif '_R2_001.fastq' in x:
                 if name not in files:
                     files[name] = ['', '']
-                files[name][1] = f"{r}/{x}"
-            else:
-                pass
+
+                files[name][int(matched.group(2)) - 1] = entry.path
 
     with open(output_file, 'w') as f:
         headers = ['sample-id', 'forward-absolute-filepath',